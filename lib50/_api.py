@@ -1,10 +1,10 @@
 import contextlib
 import fnmatch
 import glob
+import itertools
 import logging
 import os
 from pathlib import Path
-from packaging import version
 import re
 import shutil
 import shlex
@@ -17,7 +17,6 @@ import functools
 
 import jellyfish
 import pexpect
-import requests
 import termcolor
 
 from . import _, get_local_path
@@ -38,6 +37,15 @@ AUTH_URL = "https://submit.cs50.io"
 
 DEFAULT_FILE_LIMIT = 10000
 
+# Maximum number of paths passed to a single git add
+GIT_ADD_BATCH_SIZE = 1000
+
+# Number of seconds a remote repo's branch listing is reused for
+REMOTE_BRANCHES_TTL = 60
+
+_GIT_VERSION_RE = re.compile(r"^git version (\d+)\.(\d+)\.(\d+).*$")
+_SURROGATE_RE = re.compile(r"[\ud800-\udfff]")
+
 
 def push(tool, slug, config_loader, repo=None, data=None, prompt=lambda question, included, excluded: True, file_limit=DEFAULT_FILE_LIMIT):
     """
@@ -273,8 +281,11 @@ def files(patterns,
             tags[i] = tag[1:] if tag.startswith("!") else tag
 
     with cd(root):
+        # List every directory only once, no matter how many patterns there are
+        index = _FileIndex()
+
         # Include everything but hidden paths by default
-        included = _glob("*", limit=limit)
+        included = _glob("*", index=index, limit=limit)
         excluded = set()
 
         if patterns:
@@ -300,26 +311,21 @@ def files(patterns,
                             included.add(file)
                 # Include all files that are tagged with !include
                 elif pattern.tag in include_tags:
-                    new_included = _glob(pattern.value, limit=limit)
+                    new_included = _glob(pattern.value, index=index, limit=limit)
                     excluded -= new_included
                     included.update(new_included)
                 # Exclude all files that are tagged with !exclude
                 elif pattern.tag in exclude_tags:
-                    new_excluded = _glob(pattern.value, limit=limit)
+                    new_excluded = _glob(pattern.value, index=index, limit=limit)
                     included -= new_excluded
                     excluded.update(new_excluded)
 
             if missing_files:
                 raise MissingFilesError(missing_files)
 
-    # Exclude any files that are not valid utf8
-    invalid = set()
-    for file in included:
-        try:
-            file.encode("utf8")
-        except UnicodeEncodeError:
-            excluded.add(file.encode("utf8", "replace").decode())
-            invalid.add(file)
+    # Exclude any files that are not valid utf8 (only lone surrogates fail to encode)
+    invalid = {file for file in included if not file.isascii() and _SURROGATE_RE.search(file)}
+    excluded.update(file.encode("utf8", "replace").decode() for file in invalid)
     included -= invalid
 
     return included, excluded
@@ -425,13 +431,14 @@ def prepare(tool, branch, user, included):
             Git.working_area = f"-C {shlex.quote(str(area))}"
             git = Git().set(Git.working_area)
 
-            # Clone just .git folder
+            # Clone just .git folder, and set user name/email in its config
             try:
-                clone_command = f"clone --bare --single-branch {user.repo} .git"
+                clone = git.set(Git.cache).set("clone --bare --single-branch --depth 1 --config user.email={email} --config user.name={name}",
+                                               email=user.email, name=user.name)
                 try:
-                    run_authenticated(user, git.set(Git.cache)(f"{clone_command} --branch {branch}"))
+                    run_authenticated(user, clone("{repo} .git --branch {branch}", repo=user.repo, branch=branch))
                 except Error:
-                    run_authenticated(user, git.set(Git.cache)(clone_command))
+                    run_authenticated(user, clone("{repo} .git", repo=user.repo))
             except Error:
                 msg = _("Make sure your username and/or personal access token are valid and {} is enabled for your account. To enable {}, ").format(tool, tool)
                 if user.org != DEFAULT_PUSH_ORG:
@@ -452,18 +459,16 @@ def prepare(tool, branch, user, included):
             except Error:
                 pass
 
-            # Set user name/email in repo config
-            run(git("config user.email {email}", email=user.email))
-            run(git("config user.name {name}", name=user.name))
-
             # Switch to branch without checkout
             run(git("symbolic-ref HEAD {ref}", ref=f"refs/heads/{branch}"))
 
-            # Git add all included files
-            run(git(f"add -f {' '.join(shlex.quote(f) for f in included)}"))
+            # Git add all included files, in batches so as not to exceed ARG_MAX
+            paths = sorted(included)
+            for i in range(0, len(paths), GIT_ADD_BATCH_SIZE):
+                run(git(f"add -f -- {_quote_paths(paths[i:i + GIT_ADD_BATCH_SIZE])}"))
 
             # Remove gitattributes from included
-            if Path(".gitattributes").exists() and ".gitattributes" in included:
+            if ".gitattributes" in included and Path(".gitattributes").exists():
                 included.remove(".gitattributes")
 
             # Add any oversized files through git-lfs
@@ -535,17 +540,16 @@ def fetch_config(slug):
     # Parse slug
     slug = Slug(slug)
 
-    # Get config file (.cs50.yaml)
-    try:
-        yaml_content = get_content(slug.org, slug.repo, slug.branch, slug.problem / ".cs50.yaml")
-    except InvalidSlugError:
-        yaml_content = None
+    def get_config(filename):
+        try:
+            return get_content(slug.org, slug.repo, slug.branch, (slug.problem / filename).as_posix())
+        except InvalidSlugError:
+            return None
 
-    # Get config file (.cs50.yml)
-    try:
-        yml_content = get_content(slug.org, slug.repo, slug.branch, slug.problem / ".cs50.yml")
-    except InvalidSlugError:
-        yml_content = None
+    # Get both config files (.cs50.yaml and .cs50.yml) concurrently
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        yaml_content, yml_content = executor.map(get_config, [".cs50.yaml", ".cs50.yml"])
 
     # If neither exists, error
     if not yml_content and not yaml_content:
@@ -648,11 +652,14 @@ def _rank_similar_slugs(target_slug, other_slugs):
     return sorted(scores, key=lambda k: scores[k], reverse=True)
 
 
+@functools.lru_cache(maxsize=1)
 def check_dependencies():
     """
     Check that dependencies are installed:
     - require git 2.7+, so that credential-cache--daemon ignores SIGHUP
         https://github.com/git/git/blob/v2.7.0/credential-cache--daemon.c
+
+    Only a successful check is cached, a failed check raises and is retried on the next call.
     """
 
     # Check that git is installed
@@ -661,8 +668,8 @@ def check_dependencies():
 
     # Check that git --version > 2.7
     _version = subprocess.check_output(["git", "--version"]).decode("utf-8")
-    matches = re.search(r"^git version (\d+\.\d+\.\d+).*$", _version)
-    if not matches or version.parse(matches.group(1)) < version.parse("2.7.0"):
+    matches = _GIT_VERSION_RE.search(_version)
+    if not matches or tuple(map(int, matches.groups())) < (2, 7, 0):
         raise Error(_("You have an old version of git. Install version 2.7 or later, then re-run!"))
 
 
@@ -744,14 +751,11 @@ class Slug:
         # Assert begin/end of slug are correct
         self._check_endings()
 
-        # Find third "/" in identifier
-        idx = self.slug.find("/", self.slug.find("/") + 1)
-        if idx == -1:
-            raise InvalidSlugError(_("Invalid slug"))
-
         # Split slug in <org>/<repo>/<remainder>
-        remainder = self.slug[idx + 1:]
-        self.org, self.repo = self.slug.split("/")[:2]
+        parts = self.slug.split("/", 2)
+        if len(parts) < 3:
+            raise InvalidSlugError(_("Invalid slug"))
+        self.org, self.repo, remainder = parts
 
         credentials = f"{github_token}:x-oauth-basic@" if github_token else ""
         self.origin = f"https://{credentials}github.com/{self.org}/{self.repo}"
@@ -768,11 +772,14 @@ class Slug:
         except Error:
             branches = []
 
-        # Find a matching branch
-        for branch in branches:
-            if remainder.startswith(f"{branch}"):
+        # Find a matching branch, preferring the longest one (e.g. 2019/x over 2019)
+        branches = set(branches)
+        parts = remainder.split("/")
+        for i in range(len(parts), 0, -1):
+            branch = "/".join(parts[:i])
+            if branch in branches:
                 self.branch = branch
-                self.problem = Path(remainder[len(branch) + 1:])
+                self.problem = Path("/".join(parts[i:]))
                 break
         else:
             raise InvalidSlugError(_("Invalid slug: {}").format(self.slug))
@@ -793,24 +800,9 @@ class Slug:
         """Get branches from org/repo."""
         if self.offline:
             local_path = get_local_path() / self.org / self.repo
-            output = run(f"git -C {shlex.quote(str(local_path))} show-ref --heads").split("\n")
-        else:
-            cmd = f"git ls-remote --heads {self.origin}"
-            try:
-                with spawn(cmd, timeout=3) as child:
-                    output = child.read().strip().split("\r\n")
-            except pexpect.TIMEOUT:
-                if "Username for" in child.buffer:
-                    return []
-                else:
-                    raise TimeoutError(3)
-            except Error:
-                if "Could not resolve host" in child.before + child.buffer:
-                    raise ConnectionError
-                raise
-
-        # Parse get_refs output for the actual branch names
-        return (line.split()[1].replace("refs/heads/", "") for line in output)
+            output = run(f"git -C {shlex.quote(str(local_path))} show-ref --heads").splitlines()
+            return _parse_branches(output)
+        return _get_remote_branches(self.origin)
 
     @staticmethod
     def normalize_case(slug):
@@ -826,6 +818,44 @@ class Slug:
         return self.slug
 
 
+_remote_branches = {}
+
+
+def _get_remote_branches(origin):
+    """
+    Get all branches of the remote repo at origin.
+    Listings are reused for REMOTE_BRANCHES_TTL seconds, such that parsing the same slug repeatedly
+    (e.g. in local() and connect()) only queries GitHub once, while newly published branches still show up.
+    """
+    cached = _remote_branches.get(origin)
+    if cached and time.monotonic() - cached[0] < REMOTE_BRANCHES_TTL:
+        return cached[1]
+
+    cmd = f"git ls-remote --heads {origin}"
+    try:
+        with spawn(cmd, timeout=3) as child:
+            output = child.read().strip().splitlines()
+    except pexpect.TIMEOUT:
+        # Don't remember a failed lookup, the next one may well succeed
+        if "Username for" in child.buffer:
+            return ()
+        else:
+            raise TimeoutError(3)
+    except Error:
+        if "Could not resolve host" in child.before + child.buffer:
+            raise ConnectionError
+        raise
+
+    branches = _parse_branches(output)
+    _remote_branches[origin] = (time.monotonic(), branches)
+    return branches
+
+
+def _parse_branches(refs):
+    """Parse the output of git show-ref/ls-remote for the actual branch names."""
+    return tuple(line.split()[1].replace("refs/heads/", "") for line in refs)
+
+
 class ProgressBar:
     """
     A contextmanager that shows a progress bar starting with message.
@@ -857,25 +887,32 @@ class ProgressBar:
 
         self._message = message
         self._progressing = False
+        self._stopped = threading.Event()
         self._thread = None
         self._print = functools.partial(print, file=output_stream)
 
+        # Only flush every tick if someone is watching
+        isatty = getattr(output_stream, "isatty", None)
+        self._flush_ticks = bool(isatty and isatty())
+
     def stop(self):
         """Stop the progress bar."""
         if self._progressing:
             self._progressing = False
+            self._stopped.set()
             self._thread.join()
 
     def __enter__(self):
         def progress_runner():
             self._print(f"{self._message}...", end="", flush=True)
-            while self._progressing:
-                self._print(".", end="", flush=True)
-                time.sleep(1 / ProgressBar.TICKS_PER_SECOND if ProgressBar.TICKS_PER_SECOND else 0)
-            self._print()
+            while not self._stopped.is_set():
+                self._print(".", end="", flush=self._flush_ticks)
+                self._stopped.wait(1 / ProgressBar.TICKS_PER_SECOND if ProgressBar.TICKS_PER_SECOND else 0)
+            self._print(flush=True)
 
         if not ProgressBar.DISABLED:
             self._progressing = True
+            self._stopped.clear()
             self._thread = threading.Thread(target=progress_runner)
             self._thread.start()
         else:
@@ -918,13 +955,14 @@ def spawn(command, quiet=False, timeout=None):
             child.logfile_read = _StreamToLogger(logger.debug)
         yield child
     except BaseException:
-        child.close()
+        child.close(force=True)
         raise
     else:
         if child.isalive():
             try:
                 child.expect(pexpect.EOF, timeout=timeout)
             except pexpect.TIMEOUT:
+                child.close(force=True)
                 raise Error()
         child.close(force=True)
         if child.signalstatus is None and child.exitstatus != 0:
@@ -933,25 +971,47 @@ def spawn(command, quiet=False, timeout=None):
 
 
 def run(command, quiet=False, timeout=None):
-    """Run a command, returns command output."""
+    """
+    Run a command that does not require user input, returns command output.
+    Commands that could prompt the user should be run through ``spawn`` instead.
+    """
     try:
-        with spawn(command, quiet, timeout) as child:
-            command_output = child.read().strip().replace("\r\n", "\n")
-    except pexpect.TIMEOUT:
+        process = subprocess.run(
+            shlex.split(command),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            timeout=timeout)
+    except subprocess.TimeoutExpired:
         logger.info(f"command {command} timed out")
         raise TimeoutError(timeout)
 
-    return command_output
+    if not quiet:
+        # Log command output to logger
+        stream = _StreamToLogger(logger.debug)
+        stream.write(process.stdout)
+        stream.write(process.stderr)
+
+    if process.returncode != 0:
+        logger.debug("{} exited with {}".format(command, process.returncode))
+        raise Error()
 
+    return process.stdout.strip()
 
-def _glob(pattern, skip_dirs=False, limit=DEFAULT_FILE_LIMIT):
+
+def _glob(pattern, index=None, limit=DEFAULT_FILE_LIMIT):
     """
     Glob pattern, expand directories, return iterator over matching files.
     Throws ``lib50.TooManyFilesError`` if more than ``limit`` files are globbed.
+    Pass the same ``_FileIndex`` for multiple patterns to list every directory only once.
     """
+    if index is None:
+        index = _FileIndex()
+
     # Implicit recursive iff no / in pattern and starts with *
-    files = glob.iglob(f"**/{pattern}" if "/" not in pattern and pattern.startswith("*")
-                       else pattern, recursive=True)
+    files = index.glob(f"**/{pattern}" if "/" not in pattern and pattern.startswith("*")
+                       else pattern)
 
     all_files = set()
 
@@ -963,16 +1023,127 @@ def _glob(pattern, skip_dirs=False, limit=DEFAULT_FILE_LIMIT):
 
     # Expand dirs
     for file in files:
-        if os.path.isdir(file) and not skip_dirs:
-            for f in _glob(f"{file}/**/*", skip_dirs=True):
-                if not os.path.isdir(f):
-                    add_file(f)
+        if index.isdir(file):
+            for f in index.files(file):
+                add_file(f)
         else:
             add_file(file)
 
     return all_files
 
 
+class _FileIndex:
+    """
+    A cache of directory listings for globbing many patterns while listing each directory only once.
+    Globbing follows the same rules as ``glob.iglob(pattern, recursive=True)``.
+    """
+
+    def __init__(self):
+        self._listings = {}
+
+    def glob(self, pattern):
+        """Yield all paths matching pattern."""
+        for path in self._iglob(pattern, dironly=False):
+            # Like glob.iglob, leave out the empty match for the current directory (e.g. for "**")
+            if path:
+                yield path
+
+    def files(self, dirname):
+        """Yield all files in dirname and its subdirectories, skipping hidden files and directories."""
+        for name, is_dir in self._listing(dirname).items():
+            if not name.startswith("."):
+                path = os.path.join(dirname, name)
+                if is_dir:
+                    yield from self.files(path)
+                else:
+                    yield path
+
+    def isdir(self, path):
+        """Check whether path is a directory, without a stat if its parent directory is already listed."""
+        dirname, basename = os.path.split(path)
+        listing = self._listings.get(dirname or os.curdir, {})
+        if basename in listing:
+            return listing[basename]
+        return os.path.isdir(path)
+
+    def _listing(self, dirname):
+        """Map every name in dirname to whether it is a directory, listing dirname on first use."""
+        key = dirname or os.curdir
+        try:
+            return self._listings[key]
+        except KeyError:
+            pass
+
+        listing = {}
+        try:
+            with os.scandir(key) as entries:
+                for entry in entries:
+                    try:
+                        listing[entry.name] = entry.is_dir()
+                    except OSError:
+                        listing[entry.name] = False
+        except OSError:
+            pass
+
+        self._listings[key] = listing
+        return listing
+
+    def _listdir(self, dirname, dironly):
+        return [name for name, is_dir in self._listing(dirname).items() if is_dir or not dironly]
+
+    def _iglob(self, pathname, dironly):
+        dirname, basename = os.path.split(pathname)
+
+        # No wildcards, just check whether the path exists
+        if not glob.has_magic(pathname):
+            if basename:
+                if os.path.lexists(pathname):
+                    yield pathname
+            # Patterns ending with a slash only match directories
+            elif os.path.isdir(dirname):
+                yield pathname
+            return
+
+        if not dirname:
+            yield from self._glob_in_dir(dirname, basename, dironly)
+            return
+
+        if dirname != pathname and glob.has_magic(dirname):
+            dirs = self._iglob(dirname, dironly=True)
+        else:
+            dirs = [dirname]
+
+        for dirname in dirs:
+            for name in self._glob_in_dir(dirname, basename, dironly):
+                yield os.path.join(dirname, name)
+
+    def _glob_in_dir(self, dirname, basename, dironly):
+        # ** matches the directory itself and everything below it
+        if basename == "**":
+            return itertools.chain([""], self._rlistdir(dirname, dironly))
+
+        if glob.has_magic(basename):
+            names = self._listdir(dirname, dironly)
+            # Wildcards only match hidden files if the pattern itself starts with a .
+            if not basename.startswith("."):
+                names = [name for name in names if not name.startswith(".")]
+            return fnmatch.filter(names, basename)
+
+        if basename:
+            return [basename] if os.path.lexists(os.path.join(dirname, basename)) else []
+        return [basename] if os.path.isdir(dirname) else []
+
+    def _rlistdir(self, dirname, dironly):
+        for name, is_dir in self._listing(dirname).items():
+            if name.startswith(".") or (dironly and not is_dir):
+                continue
+            yield name
+            if is_dir:
+                path = os.path.join(dirname, name) if dirname else name
+                for subname in self._rlistdir(path, dironly):
+                    yield os.path.join(name, subname)
+
+
 def _match_files(universe, pattern):
     """From a universe of files, get just those files that match the pattern."""
     # Implicit recursive iff no / in pattern and starts with *
@@ -982,11 +1153,25 @@ def _match_files(universe, pattern):
     return set(file for file in universe if pattern.match(file))
 
 
+@functools.lru_cache(maxsize=1)
+def _get_session():
+    """
+    Get a session shared by all requests, such that subsequent requests to the same host reuse the same connection.
+    requests is imported lazily (here and in get_content), as it is slow to import and not needed for most of lib50.
+    """
+    import requests
+    session = requests.Session()
+    session.headers["User-Agent"] = f"lib50 {session.headers['User-Agent']}"
+    return session
+
+
 def get_content(org, repo, branch, filepath):
     """Get all content from org/repo/branch/filepath at GitHub."""
+    import requests
+
     url = "https://github.com/{}/{}/raw/{}/{}".format(org, repo, branch, filepath)
     try:
-        r = requests.get(url)
+        r = _get_session().get(url)
         if not r.ok:
             if r.status_code == 404:
                 raise InvalidSlugError(_("Invalid slug. Did you mean to submit something else?"))
@@ -1013,7 +1198,7 @@ def check_github_status():
     :raises lib50.ConnectionError: if the Git Operations and/or API requests components show an increase in errors.
     """
     # https://www.githubstatus.com/api
-    status_result = requests.get("https://kctbh9vrtdwd.statuspage.io/api/v2/components.json")
+    status_result = _get_session().get("https://kctbh9vrtdwd.statuspage.io/api/v2/components.json")
 
     # If status check failed
     if not status_result.ok:
@@ -1043,10 +1228,10 @@ def _lfs_add(files, git):
     larges, huges = [], []
     for file in files:
         size = os.path.getsize(file)
-        if size > (100 * 1024 * 1024):
-            larges.append(file)
-        elif size > (2 * 1024 * 1024 * 1024):
+        if size > (2 * 1024 * 1024 * 1024):
             huges.append(file)
+        elif size > (100 * 1024 * 1024):
+            larges.append(file)
 
     # Raise Error if a file is >2GB
     if huges:
@@ -1068,14 +1253,19 @@ def _lfs_add(files, git):
         # For pre-push hook
         run(git("config credential.helper cache"))
 
-        # Rm previously added file, have lfs track file, add file again
-        for large in larges:
-            run(git("rm --cached {large}", large=large))
-            run(git("lfs track {large}", large=large))
-            run(git("add {large}", large=large))
+        # Rm previously added files, have lfs track files, add files again
+        quoted = _quote_paths(larges)
+        run(git(f"rm --cached -- {quoted}"))
+        run(git(f"lfs track -- {quoted}"))
+        run(git(f"add -- {quoted}"))
         run(git("add --force .gitattributes"))
 
 
+def _quote_paths(paths):
+    """Shell-quote paths into a single string of arguments that can be passed through Git's str.format."""
+    return " ".join(shlex.quote(path) for path in paths).replace("{", "{{").replace("}", "}}")
+
+
 def _is_relative_to(path, *others):
     """The is_relative_to method for Paths is Python 3.9+ so we implement it here."""
     try:
@@ -112,6 +112,12 @@ def _authenticate_ssh(org, repo=None):
         PASSPHRASE_PROMPT = 2
         NEW_KEY = 3
 
+    # Without an ssh-agent or any keys, ssh is bound to fail, so skip the round-trip to GitHub
+    if not _has_ssh_identity():
+        if not os.environ.get("CODESPACES"):
+            _show_gh_changes_warning()
+        return None
+
     # Require ssh-agent
     child = pexpect.spawn("ssh -p443 -T git@ssh.github.com", encoding="utf8")
 
@@ -124,6 +130,7 @@ def _authenticate_ssh(org, repo=None):
             "Are you sure you want to continue connecting"
         ]))
     except (pexpect.EOF, pexpect.TIMEOUT):
+        child.close(force=True)
         return None
 
     passphrase = ""
@@ -174,7 +181,7 @@ def _authenticate_ssh(org, repo=None):
                 _show_gh_changes_warning()
             return None
     finally:
-        child.close()
+        child.close(force=True)
 
     return User(name=username,
                 repo=f"ssh://git@ssh.github.com:443/{org}/{username if repo is None else repo}",
@@ -182,6 +189,18 @@ def _authenticate_ssh(org, repo=None):
                 passphrase=passphrase)
 
 
+def _has_ssh_identity():
+    """Check whether ssh has any key to offer, either through an ssh-agent or from ~/.ssh."""
+    if os.environ.get("SSH_AUTH_SOCK"):
+        return True
+
+    try:
+        return any(path.name == "config" or path.name.startswith("id_")
+                   for path in (Path.home() / ".ssh").iterdir())
+    except OSError:
+        return False
+
+
 @contextlib.contextmanager
 def _authenticate_https(org, repo=None):
     """Try authenticating via HTTPS, if succesful yields User, otherwise raises Error."""
@@ -310,18 +329,30 @@ def _prompt_password(prompt="Password: "):
     password_bytes = []
     password_string = ""
 
-    with _no_echo_stdin():
+    def read_stdin():
+        """Yield bytes from stdin, reading all that is available (e.g. a pasted token) at once."""
+        stdin = sys.stdin.buffer
         while True:
-            # Read one byte
-            ch = sys.stdin.buffer.read(1)[0]
+            # Look at what is available without consuming it, such that
+            # anything after Enter is left on stdin for whoever reads next
+            available = len(stdin.peek())
+            if not available:
+                raise EOFError
+            for _ in range(available):
+                yield stdin.read(1)[0]
+            # Show the asterisks for this chunk before waiting on the next
+            sys.stdout.flush()
+
+    with _no_echo_stdin():
+        for ch in read_stdin():
             # If user presses Enter or ctrl-d
             if ch in (ord("\r"), ord("\n"), 4):
-                print("\r")
+                print("\r", flush=True)
                 break
             # Del
             elif ch == 127:
                 if len(password_string) > 0:
-                    print("\b \b", end="", flush=True)
+                    print("\b \b", end="")
                 # Remove last char and its corresponding bytes
                 password_string = password_string[:-1]
                 password_bytes = list(password_string.encode("utf8"))
@@ -338,7 +369,7 @@ def _prompt_password(prompt="Password: "):
                 except UnicodeDecodeError:
                     pass
                 else:
-                    print("*", end="", flush=True)
+                    print("*", end="")
 
     if not password_string:
         print("Password cannot be empty, please try again.")
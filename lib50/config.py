@@ -3,17 +3,11 @@
 import collections
 import enum
 
-import yaml
 import os
 import pathlib
 from ._errors import InvalidConfigError, Error, MissingToolError
 from . import _
 
-try:
-    from yaml import CSafeLoader as SafeLoader
-except ImportError:
-    from yaml import SafeLoader
-
 
 def get_config_filepath(path):
     """
@@ -185,6 +179,9 @@ class Loader:
         :raises lib50.InvalidConfigError: in case a tag is misplaced, or the content is not valid yaml.
         :raises lib50.MissingToolError: in case the tool does not occur in the content.
         """
+        # yaml is slow to import, so only import it once there is something to parse
+        import yaml
+
         # Try parsing the YAML with global tags
         try:
             config = yaml.load(content, Loader=self._loader(self._global_tags))
@@ -231,6 +228,11 @@ class Loader:
 
     def _loader(self, tags):
         """Create a yaml Loader."""
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
+
         class ConfigLoader(SafeLoader):
             pass
         ConfigLoader.add_multi_constructor("", lambda loader, prefix, node: Loader._TaggedYamlValue(node.value, node.tag, *tags))
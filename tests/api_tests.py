@@ -1,32 +1,32 @@
 import unittest
+from unittest import mock
 import os
 import sys
 import contextlib
 import pathlib
 import tempfile
+import time
 import io
-import re
-import logging
 import subprocess
-import time
 import termcolor
 import pexpect
 
 import lib50._api
 import lib50.authentication
 
+
+def _git(repo, *args):
+    """Run git in repo, failing loudly if it does not succeed."""
+    subprocess.run(["git", "-C", str(repo), *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 class TestGit(unittest.TestCase):
     def setUp(self):
         self.info_output = []
 
-        self.old_info = lib50._api.logger.info
-        self.old_debug = logging.debug
-
-        lib50._api.logger.info = lambda msg : self.info_output.append(msg)
-
-    def tearDown(self):
-        lib50._api.logger.info = self.old_info
-        lib50._api.logger.debug = self.old_debug
+        patcher = mock.patch.object(lib50._api.logger, "info", side_effect=self.info_output.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_no_args(self):
         self.assertEqual(lib50._api.Git()("foo"), "git foo")
@@ -66,18 +66,26 @@ class TestGit(unittest.TestCase):
             lib50._api.Git.cache = ""
 
 class TestSlug(unittest.TestCase):
-    def test_wrong_format(self):
-        with self.assertRaises(lib50._api.InvalidSlugError):
-            lib50._api.Slug("/cs50/lib50/tests/bar")
+    # Branches served in place of `git ls-remote`, per origin
+    REMOTE_BRANCHES = {
+        "https://github.com/cs50/lib50": ("main", "tests"),
+    }
 
-        with self.assertRaises(lib50._api.InvalidSlugError):
-            lib50._api.Slug("cs50/lib50/tests/bar/")
+    def setUp(self):
+        def get_remote_branches(origin):
+            try:
+                return self.REMOTE_BRANCHES[origin]
+            except KeyError:
+                raise lib50._api.Error(f"Repository not found: {origin}")
 
-        with self.assertRaises(lib50._api.InvalidSlugError):
-            lib50._api.Slug("/cs50/lib50/tests/bar/")
+        patcher = mock.patch.object(lib50._api, "_get_remote_branches", side_effect=get_remote_branches)
+        self.get_remote_branches = patcher.start()
+        self.addCleanup(patcher.stop)
 
-        with self.assertRaises(lib50._api.InvalidSlugError):
-            lib50._api.Slug("cs50/problems2")
+    def test_wrong_format(self):
+        for slug in ["/cs50/lib50/tests/bar", "cs50/lib50/tests/bar/", "/cs50/lib50/tests/bar/", "cs50/problems2"]:
+            with self.subTest(slug=slug), self.assertRaises(lib50._api.InvalidSlugError):
+                lib50._api.Slug(slug)
 
     def test_case(self):
         with self.assertRaises(lib50._api.InvalidSlugError):
@@ -85,41 +93,35 @@ class TestSlug(unittest.TestCase):
         self.assertEqual(lib50._api.Slug("CS50/LiB50/tests/bar").slug, "cs50/lib50/tests/bar")
 
     def test_online(self):
-        if os.environ.get("TRAVIS") == "true":
-            self.skipTest("Cannot test online in travis.")
-
         slug = lib50._api.Slug("cs50/lib50/tests/bar")
         self.assertEqual(slug.slug, "cs50/lib50/tests/bar")
         self.assertEqual(slug.org, "cs50")
         self.assertEqual(slug.repo, "lib50")
         self.assertEqual(slug.branch, "tests")
         self.assertEqual(slug.problem, pathlib.Path("bar"))
+        self.get_remote_branches.assert_called_once_with("https://github.com/cs50/lib50")
 
     def test_wrong_slug_online(self):
         with self.assertRaises(lib50._api.InvalidSlugError):
             lib50._api.Slug("cs50/does/not/exist")
+        self.get_remote_branches.assert_called_once_with("https://github.com/cs50/does")
 
     def test_offline(self):
         try:
             old_local_path = lib50.get_local_path()
-            old_wd = os.getcwd()
             temp_dir = tempfile.TemporaryDirectory()
             lib50.set_local_path(temp_dir.name)
-            path = pathlib.Path(lib50.get_local_path()) / "foo" / "bar" / "baz"
-            os.makedirs(path)
+            repo = pathlib.Path(lib50.get_local_path()) / "foo" / "bar"
+            os.makedirs(repo / "baz")
 
-            os.chdir(pathlib.Path(lib50.get_local_path()) / "foo" / "bar")
-            subprocess.check_output(["git", "init"])
-            subprocess.check_output(["git", "config", "user.name", '"foo"'])
-            subprocess.check_output(["git", "config", "user.email", '"bar@baz.com"'])
-            subprocess.check_output(["git", "checkout", "-b", "main"])
+            _git(repo, "init")
+            _git(repo, "config", "user.name", "foo")
+            _git(repo, "config", "user.email", "bar@baz.com")
+            _git(repo, "checkout", "-b", "main")
 
-            os.chdir(path)
-
-            with open(".cs50.yaml", "w") as f:
-                pass
-            subprocess.check_output(["git", "add", ".cs50.yaml"])
-            out = subprocess.check_output(["git", "commit", "-m", "\"qux\""])
+            (repo / "baz" / ".cs50.yaml").touch()
+            _git(repo, "add", "baz/.cs50.yaml")
+            _git(repo, "commit", "-m", "qux")
 
             slug = lib50._api.Slug("foo/bar/main/baz", offline=True)
             self.assertEqual(slug.slug, "foo/bar/main/baz")
@@ -130,57 +132,140 @@ class TestSlug(unittest.TestCase):
         finally:
             lib50.set_local_path(old_local_path)
             temp_dir.cleanup()
-            os.chdir(old_wd)
 
     def test_wrong_slug_offline(self):
         with self.assertRaises(lib50._api.InvalidSlugError):
             lib50._api.Slug("cs50/does/not/exist", offline=True)
 
+    def test_longest_branch(self):
+        branches = ["2019", "master", "2019/x", "master-2"]
+        with mock.patch.object(lib50._api.Slug, "_get_branches", return_value=branches):
+            slug = lib50._api.Slug("foo/bar/master-2/baz")
+            self.assertEqual(slug.branch, "master-2")
+            self.assertEqual(slug.problem, pathlib.Path("baz"))
+
+            slug = lib50._api.Slug("foo/bar/2019/x/baz/qux")
+            self.assertEqual(slug.branch, "2019/x")
+            self.assertEqual(slug.problem, pathlib.Path("baz/qux"))
+
+            slug = lib50._api.Slug("foo/bar/2019/y/baz")
+            self.assertEqual(slug.branch, "2019")
+            self.assertEqual(slug.problem, pathlib.Path("y/baz"))
+
+            with self.assertRaises(lib50._api.InvalidSlugError):
+                lib50._api.Slug("foo/bar/master-3/baz")
+
+class TestGetRemoteBranches(unittest.TestCase):
+    def setUp(self):
+        self.child = mock.MagicMock()
+        self.child.read.return_value = "abc\trefs/heads/main\n"
+
+        patcher = mock.patch.object(lib50._api, "spawn")
+        spawn = patcher.start()
+        self.addCleanup(patcher.stop)
+        spawn.return_value.__enter__.return_value = self.child
+        spawn.return_value.__exit__.return_value = False
+        self.spawn = spawn
+
+        patcher = mock.patch.dict(lib50._api._remote_branches, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        self.assertEqual(lib50._api._get_remote_branches("foo"), ("main",))
+        self.assertEqual(lib50._api._get_remote_branches("foo"), ("main",))
+        self.assertEqual(self.spawn.call_count, 1)
+
+    def test_expires(self):
+        with mock.patch.object(lib50._api.time, "monotonic", return_value=0):
+            lib50._api._get_remote_branches("foo")
+
+        self.child.read.return_value = "abc\trefs/heads/main\ndef\trefs/heads/2019/x\n"
+        with mock.patch.object(lib50._api.time, "monotonic", return_value=lib50._api.REMOTE_BRANCHES_TTL):
+            self.assertEqual(lib50._api._get_remote_branches("foo"), ("main", "2019/x"))
+        self.assertEqual(self.spawn.call_count, 2)
+
+    def test_username_prompt_not_cached(self):
+        self.child.read.side_effect = pexpect.TIMEOUT("timeout")
+        self.child.buffer = "Username for 'https://github.com':"
+        self.assertEqual(lib50._api._get_remote_branches("foo"), ())
+
+        self.child.read.side_effect = None
+        self.assertEqual(lib50._api._get_remote_branches("foo"), ("main",))
+        self.assertEqual(self.spawn.call_count, 2)
+
+
 class TestProgressBar(unittest.TestCase):
     def test_progress(self):
         f = io.StringIO()
-        with contextlib.redirect_stdout(f):
-            with lib50._api.ProgressBar("foo", output_stream=sys.stdout):
-                pass
+        with lib50._api.ProgressBar("foo", output_stream=f):
+            pass
         self.assertTrue("foo..." in f.getvalue())
 
     def test_progress_moving(self):
         f = io.StringIO()
-        with contextlib.redirect_stdout(f):
-            try:
-                old_ticks_per_second = lib50._api.ProgressBar.TICKS_PER_SECOND
-                lib50._api.ProgressBar.TICKS_PER_SECOND = 100
-                with lib50._api.ProgressBar("foo", output_stream=sys.stdout):
-                    time.sleep(.5)
-            finally:
-                lib50._api.ProgressBar.TICKS_PER_SECOND = old_ticks_per_second
+        with mock.patch.object(lib50._api.ProgressBar, "TICKS_PER_SECOND", 100):
+            with lib50._api.ProgressBar("foo", output_stream=f):
+                time.sleep(.1)
 
         self.assertTrue("foo...." in f.getvalue())
 
+    def test_reuse(self):
+        f = io.StringIO()
+        bar = lib50._api.ProgressBar("foo", output_stream=f)
+        with mock.patch.object(lib50._api.ProgressBar, "TICKS_PER_SECOND", 100):
+            with bar:
+                time.sleep(.1)
+            first = f.getvalue()
+
+            with bar:
+                time.sleep(.1)
+
+        self.assertTrue(f.getvalue()[len(first):].startswith("foo...."))
+
     def test_disabled(self):
         f = io.StringIO()
-        with contextlib.redirect_stdout(f):
-            try:
-                old_disabled = lib50._api.ProgressBar.DISABLED
-                lib50._api.ProgressBar.DISABLED = True
-                old_ticks_per_second = lib50._api.ProgressBar.TICKS_PER_SECOND
-                lib50._api.ProgressBar.TICKS_PER_SECOND = 100
-                with lib50._api.ProgressBar("foo", output_stream=sys.stdout):
-                    time.sleep(.5)
-            finally:
-                lib50._api.ProgressBar.DISABLED = old_disabled
-                lib50._api.ProgressBar.TICKS_PER_SECOND = old_ticks_per_second
+        with mock.patch.object(lib50._api.ProgressBar, "DISABLED", True):
+            # A disabled bar starts no thread, so there is nothing to wait for
+            with lib50._api.ProgressBar("foo", output_stream=f):
+                pass
 
         self.assertEqual("foo...\n", f.getvalue())
 
+class TestLfsAdd(unittest.TestCase):
+    def setUp(self):
+        self.working_directory = tempfile.TemporaryDirectory()
+        self._wd = os.getcwd()
+        os.chdir(self.working_directory.name)
+
+    def tearDown(self):
+        self.working_directory.cleanup()
+        os.chdir(self._wd)
+
+    def test_huge_file(self):
+        with open("foo.bin", "wb") as f:
+            try:
+                f.truncate(2 * 1024 * 1024 * 1024 + 1)
+            except OSError:
+                self.skipTest("can't create a sparse file")
+
+        with self.assertRaises(lib50._api.Error) as cm:
+            lib50._api._lfs_add(["foo.bin"], lib50._api.Git())
+        self.assertIn("foo.bin", str(cm.exception))
+        self.assertNotIn("git-lfs", str(cm.exception))
+
 class TestPromptPassword(unittest.TestCase):
     @contextlib.contextmanager
-    def replace_stdin(self):
+    def replace_stdin(self, text):
+        # Feed stdin through a pipe, like piped input
+        read_fd, write_fd = os.pipe()
+        with open(write_fd, "wb") as stdin_w:
+            stdin_w.write(text.encode("utf8"))
+
         old = sys.stdin
         try:
-            with tempfile.TemporaryFile() as stdin_f:
+            with open(read_fd, encoding="utf8") as stdin_f:
                 sys.stdin = stdin_f
-                sys.stdin.buffer = sys.stdin
                 yield sys.stdin
         finally:
             sys.stdin = old
@@ -196,40 +281,45 @@ class TestPromptPassword(unittest.TestCase):
             lib50.authentication._no_echo_stdin = mock
             yield mock
         finally:
-            lib50._api.authentication = old
+            lib50.authentication._no_echo_stdin = old
 
     def test_ascii(self):
         f = io.StringIO()
-        with self.mock_no_echo_stdin(), self.replace_stdin(), contextlib.redirect_stdout(f):
-            sys.stdin.write(bytes("foo\n".encode("utf8")))
-            sys.stdin.seek(0)
+        with self.mock_no_echo_stdin(), self.replace_stdin("foo\n"), contextlib.redirect_stdout(f):
             password = lib50.authentication._prompt_password()
 
         self.assertEqual(password, "foo")
         self.assertEqual(f.getvalue().count("*"), 3)
 
+    def test_leaves_next_line(self):
+        f = io.StringIO()
+        with self.mock_no_echo_stdin(), self.replace_stdin("pw\nnext\n"), contextlib.redirect_stdout(f):
+            password = lib50.authentication._prompt_password()
+            next_line = sys.stdin.readline()
+
+        self.assertEqual(password, "pw")
+        self.assertEqual(next_line, "next\n")
+
     def test_unicode(self):
         f = io.StringIO()
-        with self.mock_no_echo_stdin(), self.replace_stdin(), contextlib.redirect_stdout(f):
-            sys.stdin.write(bytes("↔♣¾€\n".encode("utf8")))
-            sys.stdin.seek(0)
+        with self.mock_no_echo_stdin(), self.replace_stdin("↔♣¾€\n"), contextlib.redirect_stdout(f):
             password = lib50.authentication._prompt_password()
 
         self.assertEqual(password, "↔♣¾€")
         self.assertEqual(f.getvalue().count("*"), 4)
 
     def test_unicode_del(self):
-        def resolve_backspaces(str):
-            while True:
-                temp = re.sub('.\b', '', str, count=1)
-                if len(str) == len(temp):
-                    return re.sub('\b+', '', temp)
-                str = temp
+        def resolve_backspaces(text):
+            chars = []
+            for char in text:
+                if char != "\b":
+                    chars.append(char)
+                elif chars:
+                    chars.pop()
+            return "".join(chars)
 
         f = io.StringIO()
-        with self.mock_no_echo_stdin(), self.replace_stdin(), contextlib.redirect_stdout(f):
-            sys.stdin.write(bytes(f"↔{chr(127)}♣¾{chr(127)}€\n".encode("utf8")))
-            sys.stdin.seek(0)
+        with self.mock_no_echo_stdin(), self.replace_stdin(f"↔{chr(127)}♣¾{chr(127)}€\n"), contextlib.redirect_stdout(f):
             password = lib50.authentication._prompt_password()
 
         self.assertEqual(password, "♣€")
@@ -245,12 +335,13 @@ class TestGetLocalSlugs(unittest.TestCase):
         os.makedirs(path)
         with open(path / ".cs50.yml", "w") as f:
             f.write("foo50: true\n")
-        pexpect.run(f"git -C {path.parent.parent} init")
-        pexpect.run(f'git -C {path.parent.parent} config user.name "foo"')
-        pexpect.run(f'git -C {path.parent.parent} config user.email "bar@baz.com"')
-        pexpect.run(f"git -C {path.parent.parent} checkout -b main")
-        pexpect.run(f"git -C {path.parent.parent} add .")
-        pexpect.run(f"git -C {path.parent.parent} commit -m \"message\"")
+
+        _git(path.parent, "init")
+        _git(path.parent, "config", "user.name", "foo")
+        _git(path.parent, "config", "user.email", "bar@baz.com")
+        _git(path.parent, "checkout", "-b", "main")
+        _git(path.parent, "add", ".")
+        _git(path.parent, "commit", "-m", "message")
 
     def tearDown(self):
         self.temp_dir.cleanup()
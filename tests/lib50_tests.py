@@ -164,6 +164,43 @@ class TestFiles(unittest.TestCase):
         self.assertEqual(set(included), {"foo.py", "bar.c"})
         self.assertEqual(set(excluded), set())
 
+    def test_required_in_subdirectory(self):
+        os.mkdir("foo")
+        open("foo/bar.py", "w").close()
+
+        content = \
+            "check50:\n" \
+            "  files:\n" \
+            "    - !exclude \"*\"\n" \
+            "    - !require foo/bar.py\n"
+
+        config = self.loader.load(content)
+
+        included, excluded = lib50.files(config.get("files"))
+        self.assertEqual(set(included), {"foo/bar.py"})
+        self.assertEqual(set(excluded), set())
+
+        content += "    - !require foo/baz.py\n"
+
+        config = self.loader.load(content)
+
+        with self.assertRaises(lib50.MissingFilesError):
+            lib50.files(config.get("files"))
+
+    def test_required_dangling_symlink(self):
+        os.symlink("nowhere.c", "hello.c")
+
+        content = \
+            "check50:\n" \
+            "  files:\n" \
+            "    - !exclude \"*\"\n" \
+            "    - !require hello.c\n"
+
+        config = self.loader.load(content)
+
+        with self.assertRaises(lib50.MissingFilesError):
+            lib50.files(config.get("files"))
+
     def test_required_overwrite_exclude(self):
         content = \
             "check50:\n" \
@@ -265,6 +302,22 @@ class TestFiles(unittest.TestCase):
         self.assertEqual(set(included), {"foo/bar.py"})
         self.assertEqual(set(excluded), set())
 
+    def test_include_folder_with_glob_characters(self):
+        content = \
+            "check50:\n" \
+            "  files:\n" \
+            "    - !exclude \"*\"\n" \
+            "    - !include \"*oo]\"\n"
+
+        config = self.loader.load(content)
+
+        os.mkdir("[foo]")
+        open("[foo]/bar.py", "w").close()
+
+        included, excluded = lib50.files(config.get("files"))
+        self.assertEqual(set(included), {"[foo]/bar.py"})
+        self.assertEqual(set(excluded), set())
+
     def test_implicit_recursive(self):
         os.mkdir("foo")
         open("foo/bar.py", "w").close()